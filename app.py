@@ -1,20 +1,56 @@
-from flask import Flask, render_template, request, jsonify
-from flask_cors import CORS
-import requests
+from quart import Quart, render_template, request, jsonify
+from quart_cors import cors
+from quart.json.provider import JSONProvider
 import os
-import time
+import re
 from dotenv import load_dotenv
-import json
-from datetime import datetime, timedelta
-from collections import deque
+import logging
+from datetime import datetime
+import time
+import uuid
 import asyncio
+import functools
+from operator import itemgetter
 import aiohttp
-from urllib.parse import urlencode
+import httpx
+from aiohttp_client_cache import CachedSession, SQLiteBackend
+from aiohttp_client_cache.cache_control import DO_NOT_CACHE
+import orjson
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
+from aiolimiter import AsyncLimiter
+from cachetools import LRUCache, TTLCache
+from lxml import etree, html as lxml_html
+
+try:
+    import brotli  # not used directly; aiohttp needs it to decode br responses
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+# Use the libuv-based event loop when it's available (not on Windows)
+try:
+    import uvloop
+    uvloop.install()
+except ImportError:
+    pass
 
 load_dotenv()
 
-app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}})  # Enable CORS for all routes with all origins
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'))
+logger = logging.getLogger(__name__)
+
+class OrjsonProvider(JSONProvider):
+    """Serialize jsonify() responses with orjson instead of the stdlib json module"""
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+app = Quart(__name__)
+app.json = OrjsonProvider(app)
+app = cors(app, allow_origin="*")  # Enable CORS for all routes with all origins
 
 # API Configuration
 BARCODE_API_KEY = os.getenv('BARCODE_API_KEY')
@@ -24,15 +60,55 @@ UPC_DATABASE_API_KEY = os.getenv('UPC_DATABASE_API_KEY')
 UPC_DATABASE_API = 'https://api.upcdatabase.org/product'
 BARCODE_SPIDER_API_KEY = os.getenv('BARCODE_SPIDER_API_KEY')
 BARCODE_SPIDER_API = 'https://api.barcodespider.com/v1/lookup'
+BARCODE_LOOKUP_URL = 'https://www.barcodelookup.com/{}'
+
+# Per-source URL templates and request headers, built once at startup
+OPEN_FOOD_FACTS_URL = OPEN_FOOD_FACTS_API + '/product/{}.json'
+UPC_DATABASE_URL = UPC_DATABASE_API + '/{}'
+UPC_DATABASE_HEADERS = {
+    'Authorization': f'Bearer {UPC_DATABASE_API_KEY}',
+    'Accept': 'application/json',
+    'Content-Type': 'application/json'
+}
+BARCODE_SPIDER_URL = BARCODE_SPIDER_API + '?upc={}'
+BARCODE_SPIDER_HEADERS = {
+    'token': BARCODE_SPIDER_API_KEY,
+    'Accept': 'application/json',
+    'Content-Type': 'application/json'
+}
+BARCODE_LOOKUP_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    # Brotli pages are smaller still, but aiohttp can only decode them with brotli installed
+    'Accept-Encoding': 'gzip, deflate, br' if BROTLI_AVAILABLE else 'gzip, deflate'
+}
+BARCODE_LOOKUP_MAX_BYTES = 1024 * 1024  # stop reading product pages past this size
+BARCODE_LOOKUP_CHUNK_SIZE = 16384
 
 # Price API for retail data
 PRICE_API_KEY = os.getenv('PRICE_API_KEY')
 PRICE_API_URL = 'https://api.priceapi.com/v2'
+PRICE_API_PRODUCTS_URL = PRICE_API_URL + '/products'
+PRICE_API_PARAMS = {
+    'api_key': PRICE_API_KEY,
+    'source': 'amazon.ca,walmart.ca,canadiantire.ca,shoppersdrug.ca',
+    'country': 'ca',
+    'type': 'upc'
+}
 
 # Google Custom Search API for shopping results
 GOOGLE_SEARCH_API_KEY = os.getenv('GOOGLE_SEARCH_API_KEY')
 GOOGLE_SEARCH_CX = os.getenv('GOOGLE_SEARCH_CX')
 GOOGLE_SEARCH_API = 'https://www.googleapis.com/customsearch/v1'
+# Search parameters optimized for Canadian retail results
+GOOGLE_SEARCH_PARAMS = {
+    'key': GOOGLE_SEARCH_API_KEY,
+    'cx': GOOGLE_SEARCH_CX,
+    'gl': 'ca',  # Geolocation: Canada
+    'cr': 'countryCA',  # Country restrict: Canada
+    'num': 10,  # Number of results
+    'sort': 'date'  # Get most recent results
+}
+GOOGLE_SEARCH_QUERY = '"{0}" OR "UPC {0}" site:.ca'  # Focus on Canadian websites with UPC
 
 # Canadian retailers to specifically look for in Google Shopping results
 CANADIAN_RETAILERS = {
@@ -49,85 +125,368 @@ CANADIAN_RETAILERS = {
     'realcanadianstore': 'Real Canadian Superstore'
 }
 
+# One pass over a result's domain: group 1 is a known retailer, otherwise any .ca site
+CANADIAN_RETAILER_RE = re.compile(
+    '(' + '|'.join(re.escape(domain) for domain in CANADIAN_RETAILERS) + r')|\.ca$'
+)
+
+# Precompiled XPath queries for the Barcode Lookup product page
+BARCODE_LOOKUP_TITLE = etree.XPath('normalize-space((//h4)[1])')
+BARCODE_LOOKUP_DESCRIPTION = etree.XPath(
+    'substring-after((//text()[contains(., "Description:")])[1], "Description:")'
+)
+BARCODE_LOOKUP_FIELD = etree.XPath(
+    'normalize-space((//text()[contains(., $label)])[1]/following-sibling::span[@class="product-text"][1])'
+)
+BARCODE_LOOKUP_IMAGE = etree.XPath('string((//*[@id="largeProductImage"]//@src)[1])')
+BARCODE_LOOKUP_STORES = etree.XPath('//span[@class="store-name"]')
+# Only match nodes before the next store name, so a store without a price
+# doesn't pick up the following store's offer. Call with store=<store-name span>.
+BARCODE_LOOKUP_IN_STORE = 'count(preceding::span[@class="store-name"][1] | $store) = 1'
+BARCODE_LOOKUP_STORE_PRICE = etree.XPath(
+    f'normalize-space(following::span[@class="store-link"][1][{BARCODE_LOOKUP_IN_STORE}])'
+)
+BARCODE_LOOKUP_STORE_LINK = etree.XPath(f'string(following::*[@href][1][{BARCODE_LOOKUP_IN_STORE}]/@href)')
+BARCODE_LOOKUP_ATTRIBUTES = etree.XPath(
+    '//div[@class="product-text-label"][starts-with(normalize-space(.), "Attributes:")]'
+    '//li[@class="product-text"]/span'
+)
+
+# Deletes every non-digit character from a barcode in one pass
+NON_DIGITS = str.maketrans('', '', ''.join(chr(c) for c in range(128) if not chr(c).isdigit()))
+
+# 8-14 ASCII digits; str.isdigit() would also accept Unicode digits that upstream APIs reject
+GTIN_DIGITS = re.compile(r'\d{8,14}', re.ASCII).fullmatch
+
+# Strips currency symbols, thousands separators and whitespace from price strings in one pass
+PRICE_STRIP = str.maketrans('', '', '$,CA \t\n\xa0')
+
 # Exchange rate API
 EXCHANGE_RATE_API = f'https://v6.exchangerate-api.com/v6/{os.getenv("EXCHANGE_RATE_API_KEY")}/latest/USD'
+EXCHANGE_RATE_REFRESH_INTERVAL = 3600  # seconds between refreshes
+EXCHANGE_RATE_RETRY_INTERVAL = 60  # seconds before retrying a failed refresh
+FALLBACK_EXCHANGE_RATES = {'USD': 1.0, 'CAD': 1.35}
+# Kept current by a background task, so lookups never wait on the rate API
 exchange_rates_cache = {
     'rates': {},
-    'last_updated': None
+    'last_updated': None  # time.monotonic() of the last refresh
 }
+_exchange_rate_task = None
 
-# Rate limiting setup
+# Rate limiting setup, per client. With REDIS_URL set the limit is shared by every
+# worker; otherwise each process keeps its own limiters.
 RATE_LIMIT_PERIOD = 60
 MAX_REQUESTS = 30
-request_timestamps = deque(maxlen=MAX_REQUESTS)
+REDIS_URL = os.getenv('REDIS_URL')
+REDIS_TIMEOUT = 0.25  # seconds; past this, fall back to the in-process limit
+request_limiters = LRUCache(maxsize=10000)
+
+# Sliding-window log in a sorted set: drop entries older than the window, then
+# record this request only if the client is still under the limit
+RATE_LIMIT_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, tonumber(ARGV[1]) - tonumber(ARGV[2]))
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[3]) then
+    redis.call('ZADD', KEYS[1], ARGV[1], ARGV[4])
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+redis_client = aioredis.from_url(
+    REDIS_URL,
+    socket_connect_timeout=REDIS_TIMEOUT,
+    socket_timeout=REDIS_TIMEOUT
+) if REDIS_URL else None
+rate_limit_script = redis_client.register_script(RATE_LIMIT_SCRIPT) if redis_client else None
 
-# Add rate limiting configuration at the top of the file
+# Upstream API quotas, enforced per source so concurrent lookups queue fairly
 BARCODE_SPIDER_RATE_LIMIT = 5  # seconds between requests
-last_barcode_spider_request = 0
+UPC_DATABASE_RATE_LIMIT = 5  # requests per second
+PRICE_API_RATE_LIMIT = 5  # requests per second
+GOOGLE_SEARCH_RATE_LIMIT = 10  # requests per second
+barcode_spider_limiter = AsyncLimiter(1, BARCODE_SPIDER_RATE_LIMIT)
+upc_database_limiter = AsyncLimiter(UPC_DATABASE_RATE_LIMIT, 1)
+price_api_limiter = AsyncLimiter(PRICE_API_RATE_LIMIT, 1)
+google_search_limiter = AsyncLimiter(GOOGLE_SEARCH_RATE_LIMIT, 1)
 
-def get_exchange_rates():
-    """Get current exchange rates"""
-    now = datetime.now()
-    
-    # Use cached rates if less than 1 hour old
-    if (exchange_rates_cache['last_updated'] and 
-        (now - exchange_rates_cache['last_updated']).total_seconds() < 3600):
-        return exchange_rates_cache['rates']
+# Lookup caches, keyed by barcode. Product metadata rarely changes, store prices do.
+PRODUCT_CACHE_TTL = 3600
+METADATA_CACHE_TTL = 86400
+PRICE_CACHE_TTL = 900
+CACHE_MAX_SIZE = 10000
+product_cache = TTLCache(maxsize=CACHE_MAX_SIZE, ttl=PRODUCT_CACHE_TTL)
+# Results missing sources that hit SOURCE_TIMEOUT are only kept briefly, so the
+# next lookup after that retries the sources that didn't answer. Results that
+# stopped early because SUFFICIENT_FIELDS were filled are complete enough for
+# product_cache; re-querying them would only stop early again.
+PARTIAL_PRODUCT_CACHE_TTL = 60
+partial_product_cache = TTLCache(maxsize=CACHE_MAX_SIZE, ttl=PARTIAL_PRODUCT_CACHE_TTL)
+
+def get_cached_product(barcode):
+    """Get a cached lookup result for a barcode, complete or partial"""
+    product_data = product_cache.get(barcode)
+    if product_data is None:
+        product_data = partial_product_cache.get(barcode)
+    return product_data
+
+def cached_source(ttl):
+    """Cache a source's successful results per barcode for ttl seconds"""
+    def decorator(func):
+        cache = TTLCache(maxsize=CACHE_MAX_SIZE, ttl=ttl)
+
+        @functools.wraps(func)
+        async def wrapper(client, barcode):
+            if barcode in cache:
+                return cache[barcode]
+            result = await func(client, barcode)
+            if result:
+                cache[barcode] = result
+            return result
+        return wrapper
+    return decorator
+
+# Product fields merged from source results; the first source to fill one wins.
+# price/currency are merged separately and always come from the cheapest offer.
+PRODUCT_FIELDS = frozenset((
+    'barcode', 'upc', 'ean', 'name', 'brand', 'manufacturer', 'description',
+    'category', 'categories', 'image_url', 'mpn', 'model',
+    'size', 'weight', 'color', 'quantity', 'ingredients', 'nutrition_grade',
+    'manufacturing_places', 'countries', 'source'
+))
+
+# Lookups return once these fields are filled in, or when the timeout runs out
+SUFFICIENT_FIELDS = ('name', 'brand', 'image_url', 'price')
+SOURCE_TIMEOUT = 5  # seconds
+
+# Each upstream request gets a short timeout, so a stalled API fails fast instead of
+# holding a pooled connection. Only connect timeouts are retried: the request never
+# reached the vendor, and connect + backoff + a full attempt still fits SOURCE_TIMEOUT.
+UPSTREAM_TIMEOUT = 3  # seconds per attempt
+UPSTREAM_CONNECT_TIMEOUT = 1
+UPSTREAM_RETRIES = 1
+UPSTREAM_RETRY_BACKOFF = 0.1  # seconds, doubled after each attempt
+
+# On-disk HTTP cache for keyless sources whose responses stay valid across restarts.
+# Anything not listed here is never written to disk: that includes every API taking a
+# key, whether in a header or the query string (which the cache would store as-is),
+# and exchange rates. Those are only memoized in memory by cached_source.
+HTTP_CACHE_PATH = os.getenv('HTTP_CACHE_PATH', 'http_cache.sqlite')
+HTTP_CACHE_EXPIRY = {
+    'world.openfoodfacts.org': 7 * 86400
+}
+
+# Shared HTTP session so connections and DNS lookups are reused across lookups
+_session = None
+
+async def get_session():
+    """Get the shared aiohttp session, creating it on first use"""
+    global _session
+    if _session is None or _session.closed:
+        _session = CachedSession(
+            cache=SQLiteBackend(
+                HTTP_CACHE_PATH,
+                expire_after=DO_NOT_CACHE,
+                urls_expire_after=HTTP_CACHE_EXPIRY,
+                cache_control=True
+            ),
+            connector=aiohttp.TCPConnector(
+                limit=100,
+                limit_per_host=30,
+                ttl_dns_cache=300,
+                keepalive_timeout=60,
+                enable_cleanup_closed=True
+            ),
+            timeout=aiohttp.ClientTimeout(total=UPSTREAM_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT)
+        )
+    return _session
+
+async def close_session():
+    """Close the shared aiohttp session"""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+# Plain session for pages that must stream from the socket. CachedSession reads the
+# whole body before returning a response, and toggling its cache off is session-wide.
+_page_session = None
+
+async def get_page_session():
+    """Get the shared uncached aiohttp session, creating it on first use"""
+    global _page_session
+    if _page_session is None or _page_session.closed:
+        _page_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit_per_host=30,
+                ttl_dns_cache=300,
+                keepalive_timeout=60,
+                enable_cleanup_closed=True
+            ),
+            timeout=aiohttp.ClientTimeout(total=UPSTREAM_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT)
+        )
+    return _page_session
+
+async def close_page_session():
+    """Close the shared uncached aiohttp session"""
+    global _page_session
+    if _page_session is not None and not _page_session.closed:
+        await _page_session.close()
+    _page_session = None
+
+# HTTP/2 client for the authenticated vendor APIs, which the disk cache skips,
+# so parallel calls to the same vendor share one multiplexed connection
+_api_client = None
+
+async def get_api_client():
+    """Get the shared HTTP/2 client, creating it on first use"""
+    global _api_client
+    if _api_client is None or _api_client.is_closed:
+        _api_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+            timeout=httpx.Timeout(UPSTREAM_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT)
+        )
+    return _api_client
+
+async def close_api_client():
+    """Close the shared HTTP/2 client"""
+    global _api_client
+    if _api_client is not None and not _api_client.is_closed:
+        await _api_client.aclose()
+    _api_client = None
+
+async def retry_on_connect_timeout(request, *args, limiter=None, **kwargs):
+    """Await an upstream request, retrying with exponential backoff if connecting times out
     
+    The source's rate limiter, if given, is acquired before every attempt so retries
+    keep to the vendor's request spacing. Each attempt is capped at UPSTREAM_TIMEOUT
+    in total; httpx's own timeouts only apply per read, write or pool wait.
+    """
+    for attempt in range(UPSTREAM_RETRIES + 1):
+        if limiter is not None:
+            await limiter.acquire()
+        try:
+            return await asyncio.wait_for(request(*args, **kwargs), UPSTREAM_TIMEOUT)
+        # With no sock_read timeout set, aiohttp only raises ServerTimeoutError while connecting
+        except (aiohttp.ServerTimeoutError, httpx.ConnectTimeout):
+            if attempt == UPSTREAM_RETRIES:
+                raise
+            logger.debug("Upstream connect timed out, retrying (attempt %s)", attempt + 1)
+            await asyncio.sleep(UPSTREAM_RETRY_BACKOFF * 2 ** attempt)
+
+async def refresh_exchange_rates():
+    """Fetch the latest exchange rates into the cache, returning whether it worked"""
     try:
-        response = requests.get(EXCHANGE_RATE_API)
-        if response.status_code == 200:
-            data = response.json()
-            exchange_rates_cache['rates'] = data.get('conversion_rates', {})
-            exchange_rates_cache['last_updated'] = now
-            return exchange_rates_cache['rates']
+        session = await get_session()
+        async with await retry_on_connect_timeout(session.get, EXCHANGE_RATE_API) as response:
+            if response.status == 200:
+                data = orjson.loads(await response.read())
+                exchange_rates_cache['rates'] = data.get('conversion_rates', {})
+                exchange_rates_cache['last_updated'] = time.monotonic()
+                return True
+            logger.warning("Exchange rate API error: Status %s", response.status)
     except Exception as e:
-        print(f"Error fetching exchange rates: {str(e)}")
-    
-    # Return default rates if API call fails
-    return {'CAD': 1.35}  # Fallback rate
+        logger.warning("Error fetching exchange rates: %s", e)
+    return False
+
+async def refresh_exchange_rates_periodically(refreshed):
+    """Keep the exchange rate cache current until cancelled"""
+    while True:
+        await asyncio.sleep(EXCHANGE_RATE_REFRESH_INTERVAL if refreshed else EXCHANGE_RATE_RETRY_INTERVAL)
+        refreshed = await refresh_exchange_rates()
+
+def get_exchange_rates():
+    """Get current exchange rates, or fallback rates if they were never fetched"""
+    return exchange_rates_cache['rates'] or FALLBACK_EXCHANGE_RATES
 
-def convert_price_to_cad(price, currency='USD'):
-    """Convert price to CAD"""
+def convert_price_to_cad(price, currency, rates):
+    """Convert price to CAD using a rate table from get_exchange_rates()"""
     if not price:
         return None
         
     try:
         price = float(price)
+        currency = currency.upper()
         if currency == 'CAD':
             return price
             
-        rates = get_exchange_rates()
-        if currency.upper() in rates:
+        rate = rates.get(currency)
+        if rate:
             # Convert to USD first if not already in USD
-            if currency.upper() != 'USD':
-                price = price / rates[currency.upper()]
+            if currency != 'USD':
+                price = price / rate
             # Then convert USD to CAD
             return price * rates['CAD']
         else:
-            print(f"Currency {currency} not found in exchange rates")
+            logger.warning("Currency %s not found in exchange rates", currency)
             return price
     except (ValueError, TypeError) as e:
-        print(f"Error converting price: {str(e)}")
+        logger.warning("Error converting price: %s", e)
         return None
 
-def check_rate_limit():
-    """Check if we're within rate limits"""
-    now = datetime.now()
-    while request_timestamps and (now - request_timestamps[0]) > timedelta(seconds=RATE_LIMIT_PERIOD):
-        request_timestamps.popleft()
+def clean_barcode_digits(barcode):
+    """Strip everything but digits from a barcode"""
+    if barcode.isascii() and barcode.isdigit():
+        return barcode
+    return barcode.translate(NON_DIGITS)
+
+def has_valid_check_digit(barcode):
+    """Check the GS1 mod-10 check digit of an EAN/UPC-A/GTIN barcode"""
+    total = sum(int(digit) * (3 if i % 2 else 1) for i, digit in enumerate(reversed(barcode)))
+    return total % 10 == 0
+
+def expand_upc_e(barcode):
+    """Expand an 8-digit UPC-E barcode to the 12-digit UPC-A it stands for"""
+    number_system, digits, check = barcode[0], barcode[1:7], barcode[7]
+    last = digits[5]
+    if last in '012':
+        body = digits[:2] + last + '0000' + digits[2:5]
+    elif last == '3':
+        body = digits[:3] + '00000' + digits[3:5]
+    elif last == '4':
+        body = digits[:4] + '00000' + digits[4]
+    else:
+        body = digits[:5] + '0000' + last
+    return number_system + body + check
+
+def is_valid_gtin(barcode):
+    """Check a cleaned UPC/EAN barcode's length and check digit"""
+    if not GTIN_DIGITS(barcode):
+        return False
+    if has_valid_check_digit(barcode):
+        return True
+    # 8 digits can also be UPC-E, whose check digit is computed over the expanded UPC-A
+    return len(barcode) == 8 and barcode[0] in '01' and has_valid_check_digit(expand_upc_e(barcode))
+
+async def check_rate_limit(client_id):
+    """Check if a client is within rate limits, counting this request if so"""
+    if rate_limit_script is not None:
+        try:
+            allowed = await rate_limit_script(
+                keys=[f'rate_limit:{client_id}'],
+                args=[int(time.time() * 1000), RATE_LIMIT_PERIOD * 1000, MAX_REQUESTS, uuid.uuid4().hex]
+            )
+            return bool(allowed)
+        except RedisError as e:
+            logger.warning("Redis rate limiter unavailable, falling back to in-process limit: %s", e)
     
-    if len(request_timestamps) >= MAX_REQUESTS:
+    limiter = request_limiters.get(client_id)
+    if limiter is None:
+        limiter = request_limiters[client_id] = AsyncLimiter(MAX_REQUESTS, RATE_LIMIT_PERIOD)
+    if not limiter.has_capacity():
         return False
+    # There is capacity, so this returns without waiting
+    await limiter.acquire()
     return True
 
+@cached_source(METADATA_CACHE_TTL)
 async def get_product_from_open_food_facts(session, barcode):
     """Get product information from Open Food Facts"""
     try:
-        url = f"{OPEN_FOOD_FACTS_API}/product/{barcode}.json"
-        async with session.get(url) as response:
+        url = OPEN_FOOD_FACTS_URL.format(barcode)
+        async with await retry_on_connect_timeout(session.get, url) as response:
             if response.status == 200:
-                data = await response.json()
+                data = orjson.loads(await response.read())
                 if data.get('status') == 1:
                     product = data.get('product', {})
                     return {
@@ -144,219 +503,184 @@ async def get_product_from_open_food_facts(session, barcode):
                         'source': 'Open Food Facts'
                     }
     except Exception as e:
-        print(f"Error fetching from Open Food Facts: {str(e)}")
+        logger.warning("Error fetching from Open Food Facts: %s", e)
     return None
 
-async def get_product_from_upc_database(session, barcode):
+@cached_source(PRICE_CACHE_TTL)
+async def get_product_from_upc_database(client, barcode):
     """Get product information from UPC Database"""
     try:
-        # Format barcode to ensure it's clean and properly formatted
-        clean_barcode = ''.join(filter(str.isdigit, barcode))
+        url = UPC_DATABASE_URL.format(barcode)
         
-        # Ensure the barcode is valid
-        if not clean_barcode:
-            print(f"Invalid barcode format: {barcode}")
+        logger.debug("Fetching from UPC Database: %s", url)
+        
+        response = await retry_on_connect_timeout(
+            client.get, url, headers=UPC_DATABASE_HEADERS, limiter=upc_database_limiter
+        )
+        try:
+            response_data = orjson.loads(response.content)
+        except Exception as e:
+            logger.warning("Error parsing UPC Database response: %s", e)
             return None
             
-        url = f"{UPC_DATABASE_API}/{clean_barcode}"
-        headers = {
-            'Authorization': f'Bearer {UPC_DATABASE_API_KEY}',
-            'Accept': 'application/json',
-            'Content-Type': 'application/json'
-        }
+        logger.debug("UPC Database raw response: %s", response_data)
         
-        print(f"Fetching from UPC Database: {url}")
-        
-        async with session.get(url, headers=headers, ssl=True) as response:
-            try:
-                response_data = await response.json()
-            except Exception as e:
-                print(f"Error parsing UPC Database response: {e}")
-                return None
-                
-            print(f"UPC Database raw response: {json.dumps(response_data, indent=2)}")
+        if response.status_code == 401:
+            logger.error("UPC Database authentication failed. Please check API key.")
+            return None
             
-            if response.status == 401:
-                print("UPC Database authentication failed. Please check API key.")
-                return None
-                
-            if response.status != 200:
-                error_msg = response_data.get('error', {}).get('message', 'Unknown error')
-                print(f"UPC Database error: {error_msg}")
-                return None
-                
-            if not response_data.get('success'):
-                print(f"UPC Database error: {response_data.get('error', {}).get('message')}")
-                return None
-                
-            product = response_data.get('product', {})
-            if not product:
-                return None
-                
-            # Convert price to CAD if available
-            price = product.get('price')
-            if price:
-                try:
-                    price = float(price.replace('$', '').replace(',', ''))
-                    price_cad = convert_price_to_cad(price, product.get('currency', 'USD'))
-                except (ValueError, TypeError):
-                    price_cad = None
-            else:
+        if response.status_code != 200:
+            error_msg = response_data.get('error', {}).get('message', 'Unknown error')
+            logger.warning("UPC Database error: %s", error_msg)
+            return None
+            
+        if not response_data.get('success'):
+            logger.warning("UPC Database error: %s", response_data.get('error', {}).get('message'))
+            return None
+            
+        product = response_data.get('product', {})
+        if not product:
+            return None
+            
+        # Convert price to CAD if available
+        price = product.get('price')
+        if price:
+            try:
+                price = float(price.translate(PRICE_STRIP))
+                rates = get_exchange_rates()
+                price_cad = convert_price_to_cad(price, product.get('currency', 'USD'), rates)
+            except (ValueError, TypeError):
                 price_cad = None
-                
-            return {
-                'name': product.get('title'),
-                'description': product.get('description'),
-                'brand': product.get('brand'),
-                'manufacturer': product.get('manufacturer'),
-                'price': price_cad,
-                'currency': 'CAD',
-                'image_url': product.get('image'),
-                'upc': clean_barcode,
-                'category': product.get('category'),
-                'mpn': product.get('mpn'),
-                'source': 'UPC Database'
-            }
-                
+        else:
+            price_cad = None
+            
+        return {
+            'name': product.get('title'),
+            'description': product.get('description'),
+            'brand': product.get('brand'),
+            'manufacturer': product.get('manufacturer'),
+            'price': price_cad,
+            'currency': 'CAD',
+            'image_url': product.get('image'),
+            'upc': barcode,
+            'category': product.get('category'),
+            'mpn': product.get('mpn'),
+            'source': 'UPC Database'
+        }
+            
     except Exception as e:
-        print(f"Error fetching from UPC Database: {str(e)}")
+        logger.warning("Error fetching from UPC Database: %s", e)
     return None
 
-async def get_product_from_barcode_spider(session, barcode):
+def build_barcode_spider_store(store, rates):
+    """Normalize a Barcode Spider store offer to CAD, or None if its data is unusable"""
+    try:
+        price = float(store.get('price', 0))
+        currency = store.get('currency', 'USD')
+        
+        # Convert price to CAD
+        if currency != 'CAD':
+            price = convert_price_to_cad(price, currency, rates)
+    except (ValueError, TypeError) as e:
+        logger.warning("Error processing store data: %s", e)
+        return None
+        
+    return {
+        'store_name': store.get('store_name'),
+        'price': price,
+        'currency': 'CAD',
+        'link': store.get('link'),
+        'last_update': store.get('updated'),
+        'title': store.get('title'),
+        'availability': 'In Stock',
+        'shipping': 'See store for details'
+    }
+
+@cached_source(PRICE_CACHE_TTL)
+async def get_product_from_barcode_spider(client, barcode):
     """Get product information from Barcode Spider with improved rate limiting"""
-    global last_barcode_spider_request
-    
     try:
-        # Format barcode to ensure it's clean
-        clean_barcode = ''.join(filter(str.isdigit, barcode))
-        url = f"{BARCODE_SPIDER_API}?upc={clean_barcode}"
-        headers = {
-            'token': BARCODE_SPIDER_API_KEY,
-            'Accept': 'application/json',
-            'Content-Type': 'application/json'
-        }
+        url = BARCODE_SPIDER_URL.format(barcode)
+        
+        logger.debug("Fetching from Barcode Spider: %s", url)
+        
+        # Queue behind other lookups so requests stay spaced out
+        response = await retry_on_connect_timeout(
+            client.get, url, headers=BARCODE_SPIDER_HEADERS, limiter=barcode_spider_limiter
+        )
+        try:
+            response_data = orjson.loads(response.content)
+        except Exception as e:
+            logger.warning("Error parsing Barcode Spider response: %s", e)
+            return None
+            
+        logger.debug("Barcode Spider raw response: %s", response_data)
         
-        print(f"Fetching from Barcode Spider: {url}")
+        # No retry: the limiter spaces requests BARCODE_SPIDER_RATE_LIMIT seconds apart,
+        # so a second attempt could never land inside SOURCE_TIMEOUT
+        if response.status_code == 429:  # Too Many Requests
+            logger.warning("Rate limited by Barcode Spider")
+            return None
         
-        # Calculate time to wait for rate limiting
-        current_time = time.time()
-        time_since_last_request = current_time - last_barcode_spider_request
-        if time_since_last_request < BARCODE_SPIDER_RATE_LIMIT:
-            wait_time = BARCODE_SPIDER_RATE_LIMIT - time_since_last_request
-            print(f"Rate limiting: Waiting {wait_time:.2f} seconds before Barcode Spider request")
-            await asyncio.sleep(wait_time)
+        if response.status_code != 200:
+            logger.warning("Barcode Spider error: %s", response_data.get('item_response', {}).get('message'))
+            return None
         
-        last_barcode_spider_request = time.time()
+        product = response_data.get('item_attributes', {})
+        if not product:
+            return None
         
-        max_retries = 3
-        retry_count = 0
+        # Process store information
+        stores = response_data.get('Stores', [])
+        
+        # Look the rate table up once for every store
+        rates = get_exchange_rates() if stores else None
+        
+        store_details = [
+            details for details in (build_barcode_spider_store(store, rates) for store in stores)
+            if details is not None
+        ]
+        prices = [details['price'] for details in store_details if details['price']]
+        lowest_price = min(prices) if prices else None
+        
+        return {
+            'name': product.get('title'),
+            'description': product.get('description'),
+            'brand': product.get('brand'),
+            'manufacturer': product.get('manufacturer'),
+            'price': lowest_price,
+            'currency': 'CAD',
+            'image_url': product.get('image'),
+            'upc': barcode,
+            'ean': product.get('ean'),
+            'category': product.get('category'),
+            'mpn': product.get('mpn'),
+            'model': product.get('model'),
+            'all_stores': store_details,
+            'source': 'Barcode Spider'
+        }
         
-        while retry_count < max_retries:
-            async with session.get(url, headers=headers) as response:
-                try:
-                    response_data = await response.json()
-                except Exception as e:
-                    print(f"Error parsing Barcode Spider response: {e}")
-                    return None
-                    
-                print(f"Barcode Spider raw response: {json.dumps(response_data, indent=2)}")
-                
-                if response.status == 429:  # Too Many Requests
-                    retry_count += 1
-                    if retry_count < max_retries:
-                        wait_time = min(BARCODE_SPIDER_RATE_LIMIT * (2 ** retry_count), 15)
-                        print(f"Rate limited by Barcode Spider, waiting {wait_time} seconds and retrying... (Attempt {retry_count + 1}/{max_retries})")
-                        await asyncio.sleep(wait_time)
-                        continue
-                    else:
-                        print("Max retries reached for Barcode Spider")
-                        return None
-                
-                if response.status != 200:
-                    print(f"Barcode Spider error: {response_data.get('item_response', {}).get('message')}")
-                    return None
-                
-                product = response_data.get('item_attributes', {})
-                if not product:
-                    return None
-                
-                # Process store information
-                stores = response_data.get('Stores', [])
-                store_details = []
-                lowest_price = float('inf')
-                
-                for store in stores:
-                    try:
-                        price = float(store.get('price', 0))
-                        currency = store.get('currency', 'USD')
-                        
-                        # Convert price to CAD
-                        if currency != 'CAD':
-                            price = convert_price_to_cad(price, currency)
-                            
-                        if price and price < lowest_price:
-                            lowest_price = price
-                            
-                        store_details.append({
-                            'store_name': store.get('store_name'),
-                            'price': price,
-                            'currency': 'CAD',
-                            'link': store.get('link'),
-                            'last_update': store.get('updated'),
-                            'title': store.get('title'),
-                            'availability': 'In Stock',
-                            'shipping': 'See store for details'
-                        })
-                    except (ValueError, TypeError) as e:
-                        print(f"Error processing store data: {e}")
-                        continue
-                
-                if lowest_price == float('inf'):
-                    lowest_price = None
-                
-                return {
-                    'name': product.get('title'),
-                    'description': product.get('description'),
-                    'brand': product.get('brand'),
-                    'manufacturer': product.get('manufacturer'),
-                    'price': lowest_price,
-                    'currency': 'CAD',
-                    'image_url': product.get('image'),
-                    'upc': clean_barcode,
-                    'ean': product.get('ean'),
-                    'category': product.get('category'),
-                    'mpn': product.get('mpn'),
-                    'model': product.get('model'),
-                    'all_stores': store_details,
-                    'source': 'Barcode Spider'
-                }
-                
     except Exception as e:
-        print(f"Error fetching from Barcode Spider: {str(e)}")
+        logger.warning("Error fetching from Barcode Spider: %s", e)
     return None
 
+@cached_source(PRICE_CACHE_TTL)
 async def get_product_from_price_api(session, barcode):
     """Get product information from PriceAPI"""
     try:
-        # Updated endpoint and parameters
-        url = f"{PRICE_API_URL}/products"  # Changed from /product to /products
-        params = {
-            'api_key': PRICE_API_KEY,
-            'source': 'amazon.ca,walmart.ca,canadiantire.ca,shoppersdrug.ca',
-            'country': 'ca',
-            'values': barcode,
-            'type': 'upc'
-        }
+        params = {**PRICE_API_PARAMS, 'values': barcode}
         
-        print(f"Fetching from PriceAPI: {url}?{urlencode(params)}")
+        logger.debug("Fetching from PriceAPI: %s", PRICE_API_PRODUCTS_URL)
         
-        async with session.get(url, params=params) as response:
-            response_data = await response.json()
-            print(f"PriceAPI response status: {response.status}")
-            print(f"PriceAPI response: {json.dumps(response_data, indent=2)}")
+        async with await retry_on_connect_timeout(
+            session.get, PRICE_API_PRODUCTS_URL, params=params, limiter=price_api_limiter
+        ) as response:
+            response_data = orjson.loads(await response.read())
+            logger.debug("PriceAPI response status: %s", response.status)
+            logger.debug("PriceAPI response: %s", response_data)
             
             if response.status != 200:
-                print(f"PriceAPI error: {response_data.get('message', 'Unknown error')}")
+                logger.warning("PriceAPI error: %s", response_data.get('message', 'Unknown error'))
                 return None
                 
             products = response_data.get('products', [])
@@ -385,7 +709,7 @@ async def get_product_from_price_api(session, barcode):
                         'shipping': offer.get('shipping_options', 'See store for details')
                     })
                 except (ValueError, TypeError) as e:
-                    print(f"Error parsing store price: {e}")
+                    logger.warning("Error parsing store price: %s", e)
                     continue
             
             if lowest_price == float('inf'):
@@ -405,70 +729,59 @@ async def get_product_from_price_api(session, barcode):
             }
             
     except Exception as e:
-        print(f"Error fetching from PriceAPI: {str(e)}")
+        logger.warning("Error fetching from PriceAPI: %s", e)
     return None
 
+@cached_source(PRICE_CACHE_TTL)
 async def get_product_from_google_shopping(session, barcode):
     """Get product information from Google Shopping with focus on Canadian retailers"""
     try:
-        # Search parameters optimized for Canadian retail results
-        params = {
-            'key': GOOGLE_SEARCH_API_KEY,
-            'cx': GOOGLE_SEARCH_CX,
-            'q': f'"{barcode}" OR "UPC {barcode}" site:.ca',  # Focus on Canadian websites with UPC
-            'gl': 'ca',  # Geolocation: Canada
-            'cr': 'countryCA',  # Country restrict: Canada
-            'num': 10,  # Number of results
-            'sort': 'date'  # Get most recent results
-        }
+        params = {**GOOGLE_SEARCH_PARAMS, 'q': GOOGLE_SEARCH_QUERY.format(barcode)}
         
-        url = f"{GOOGLE_SEARCH_API}?{urlencode(params)}"
-        print(f"Fetching from Google Shopping: {url}")
+        logger.debug("Fetching from Google Shopping: %s", GOOGLE_SEARCH_API)
         
-        async with session.get(url) as response:
-            response_data = await response.json()
-            print(f"Google Shopping response status: {response.status}")
-            print(f"Google Shopping response: {json.dumps(response_data, indent=2)}")
+        async with await retry_on_connect_timeout(
+            session.get, GOOGLE_SEARCH_API, params=params, limiter=google_search_limiter
+        ) as response:
+            response_data = orjson.loads(await response.read())
+            logger.debug("Google Shopping response status: %s", response.status)
+            logger.debug("Google Shopping response: %s", response_data)
             
             if response.status != 200:
-                print(f"Google Shopping API error: {response_data.get('error', {}).get('message')}")
+                logger.warning("Google Shopping API error: %s", response_data.get('error', {}).get('message'))
                 return None
                 
             items = response_data.get('items', [])
             if not items:
-                print("No items found in Google Shopping results")
+                logger.debug("No items found in Google Shopping results")
                 return None
             
             # Process shopping results with focus on Canadian retailers
             store_details = []
             lowest_price = float('inf')
             product_info = None
+            fetched_at = datetime.now().isoformat()
             
             for item in items:
                 try:
                     # Check if the result is from a known Canadian retailer
                     display_link = item.get('displayLink', '').lower()
-                    store_name = None
-                    
-                    # Match against known Canadian retailers
-                    for retailer_domain, retailer_name in CANADIAN_RETAILERS.items():
-                        if retailer_domain in display_link:
-                            store_name = retailer_name
-                            break
+                    retailer_match = CANADIAN_RETAILER_RE.search(display_link)
+                    if not retailer_match:
+                        continue  # Skip non-Canadian retailers
                     
-                    if not store_name:
+                    if retailer_match.group(1):
+                        store_name = CANADIAN_RETAILERS[retailer_match.group(1)]
+                    else:
                         # If not a known retailer but ends in .ca, it's still Canadian
-                        if display_link.endswith('.ca'):
-                            store_name = display_link.replace('www.', '').capitalize()
-                        else:
-                            continue  # Skip non-Canadian retailers
+                        store_name = display_link.replace('www.', '').capitalize()
                     
                     # Extract price from the shopping result
                     shopping_info = item.get('pagemap', {})
                     price_str = shopping_info.get('offer', [{}])[0].get('price', '0')
                     
                     # Handle various price formats
-                    price_str = price_str.replace('$', '').replace(',', '').strip()
+                    price_str = price_str.translate(PRICE_STRIP)
                     if not price_str:
                         continue
                         
@@ -488,7 +801,7 @@ async def get_product_from_google_shopping(session, barcode):
                             'price': price,
                             'currency': 'CAD',
                             'link': item.get('link'),
-                            'last_update': datetime.now().isoformat(),
+                            'last_update': fetched_at,
                             'title': item.get('title'),
                             'availability': shopping_info.get('offer', [{}])[0].get('availability', 'Unknown'),
                             'condition': shopping_info.get('offer', [{}])[0].get('itemCondition', 'New'),
@@ -496,15 +809,12 @@ async def get_product_from_google_shopping(session, barcode):
                         })
                 
                 except Exception as e:
-                    print(f"Error processing Google Shopping item: {e}")
+                    logger.warning("Error processing Google Shopping item: %s", e)
                     continue
             
             if not store_details:
                 return None
             
-            # Sort stores by price
-            store_details.sort(key=lambda x: float(x['price']))
-            
             # Extract product details from the best result
             if product_info:
                 product_data = product_info.get('pagemap', {})
@@ -514,7 +824,7 @@ async def get_product_from_google_shopping(session, barcode):
                     'name': product.get('name') or product_info.get('title'),
                     'description': product_info.get('snippet'),
                     'brand': product.get('brand'),
-                    'price': store_details[0]['price'],  # Lowest price
+                    'price': lowest_price,
                     'currency': 'CAD',
                     'image_url': product_data.get('cse_image', [{}])[0].get('src'),
                     'upc': barcode,
@@ -524,84 +834,85 @@ async def get_product_from_google_shopping(session, barcode):
                 }
     
     except Exception as e:
-        print(f"Error fetching from Google Shopping: {str(e)}")
+        logger.warning("Error fetching from Google Shopping: %s", e)
     return None
 
+@cached_source(PRICE_CACHE_TTL)
 async def get_product_from_barcode_lookup(session, barcode):
     """Get product information from Barcode Lookup website"""
     try:
-        url = f"https://www.barcodelookup.com/{barcode}"
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
+        url = BARCODE_LOOKUP_URL.format(barcode)
         
-        print(f"Fetching from Barcode Lookup: {url}")
+        logger.debug("Fetching from Barcode Lookup: %s", url)
         
-        async with session.get(url, headers=headers) as response:
+        # Uses the uncached page session, so the size cap below applies while the body
+        # streams in. cached_source keeps the parsed result.
+        async with await retry_on_connect_timeout(session.get, url, headers=BARCODE_LOOKUP_HEADERS) as response:
             if response.status != 200:
-                print(f"Barcode Lookup error: Status {response.status}")
+                logger.warning("Barcode Lookup error: Status %s", response.status)
                 return None
-                
-            html = await response.text()
             
-            # Extract product information using string operations
-            # These are based on the HTML structure you provided
-            try:
-                # Extract title
-                title = html.split('<h4>')[1].split('</h4>')[0].strip()
-                
-                # Extract description
-                description = html.split('Description: &nbsp;')[1].split('</span>')[0].strip()
-                
-                # Extract manufacturer
-                manufacturer = html.split('Manufacturer: <span class="product-text">')[1].split('</span>')[0].strip()
+            if (response.content_length or 0) > BARCODE_LOOKUP_MAX_BYTES:
+                logger.warning("Barcode Lookup page is %s bytes, over the %s byte limit", response.content_length, BARCODE_LOOKUP_MAX_BYTES)
+                return None
                 
-                # Extract brand
-                brand = html.split('Brand: <span class="product-text">')[1].split('</span>')[0].strip()
+            # Parse the page once, feeding lxml as it downloads rather than building
+            # the whole body as a string, and pull fields out with precompiled XPath queries
+            try:
+                parser = lxml_html.HTMLParser(encoding=response.charset)
+                received = 0
+                async for chunk in response.content.iter_chunked(BARCODE_LOOKUP_CHUNK_SIZE):
+                    received += len(chunk)
+                    if received > BARCODE_LOOKUP_MAX_BYTES:
+                        logger.warning("Barcode Lookup page over %s bytes, parsing what was read", BARCODE_LOOKUP_MAX_BYTES)
+                        break
+                    parser.feed(chunk)
+                doc = parser.close()
                 
-                # Extract category
-                category = html.split('Category: <span class="product-text">')[1].split('</span>')[0].strip()
+                title = BARCODE_LOOKUP_TITLE(doc)
+                if not title:
+                    logger.debug("Barcode Lookup page has no product title")
+                    return None
                 
-                # Extract image URL
-                image_url = html.split('id="largeProductImage">')[1].split('src="')[1].split('"')[0].strip()
+                description = BARCODE_LOOKUP_DESCRIPTION(doc).strip()
+                manufacturer = BARCODE_LOOKUP_FIELD(doc, label='Manufacturer:')
+                brand = BARCODE_LOOKUP_FIELD(doc, label='Brand:')
+                category = BARCODE_LOOKUP_FIELD(doc, label='Category:')
+                image_url = BARCODE_LOOKUP_IMAGE(doc).strip()
                 
                 # Extract store information
                 stores = []
-                store_sections = html.split('<span class="store-name">')[1:]
-                for section in store_sections:
+                fetched_at = datetime.now().isoformat()
+                for store in BARCODE_LOOKUP_STORES(doc):
                     try:
-                        store_name = section.split('</span>')[0].strip().replace(':', '')
-                        price = section.split('<span class="store-link">')[1].split('</span>')[0].strip()
-                        link = section.split('href="')[1].split('"')[0].strip()
+                        store_name = store.text_content().strip().replace(':', '')
+                        price = BARCODE_LOOKUP_STORE_PRICE(store, store=store)
+                        link = BARCODE_LOOKUP_STORE_LINK(store, store=store).strip()
                         
                         # Convert price to float
-                        price_value = float(price.replace('CA$', '').strip())
+                        price_value = float(price.translate(PRICE_STRIP))
                         
                         stores.append({
                             'store_name': store_name,
                             'price': price_value,
                             'currency': 'CAD',
                             'link': link,
-                            'last_update': datetime.now().isoformat(),
+                            'last_update': fetched_at,
                             'availability': 'In Stock',
                             'shipping': 'See store for details'
                         })
                     except Exception as e:
-                        print(f"Error parsing store information: {e}")
+                        logger.warning("Error parsing store information: %s", e)
                         continue
                 
                 # Extract attributes
                 attributes = {}
-                if '<div class="product-text-label">Attributes:' in html:
-                    attr_section = html.split('<div class="product-text-label">Attributes:')[1].split('</div>')[0]
-                    attr_items = attr_section.split('<li class="product-text"><span>')[1:]
-                    for item in attr_items:
-                        try:
-                            attr = item.split('</span>')[0].strip()
-                            key, value = attr.split(': ')
-                            attributes[key.lower()] = value
-                        except:
-                            continue
+                for item in BARCODE_LOOKUP_ATTRIBUTES(doc):
+                    try:
+                        key, value = item.text_content().strip().split(': ')
+                        attributes[key.lower()] = value
+                    except ValueError:
+                        continue
                 
                 return {
                     'name': title,
@@ -620,120 +931,210 @@ async def get_product_from_barcode_lookup(session, barcode):
                 }
                 
             except Exception as e:
-                print(f"Error parsing Barcode Lookup HTML: {e}")
+                logger.warning("Error parsing Barcode Lookup HTML: %s", e)
                 return None
                 
     except Exception as e:
-        print(f"Error fetching from Barcode Lookup: {str(e)}")
+        logger.warning("Error fetching from Barcode Lookup: %s", e)
     return None
 
+def store_sort_price(store):
+    """Price to sort a store offer by, with unpriced offers last"""
+    try:
+        return float(store['price']) if store.get('price') else float('inf')
+    except (ValueError, TypeError):
+        return float('inf')
+
+# Lookups currently being fetched, so concurrent requests for a barcode share one fetch
+in_flight_lookups = {}
+
 async def fetch_all_product_data(barcode):
-    """Fetch product data from all available sources"""
-    async with aiohttp.ClientSession() as session:
-        tasks = [
-            get_product_from_open_food_facts(session, barcode),
-            get_product_from_upc_database(session, barcode),
-            get_product_from_barcode_spider(session, barcode),
-            get_product_from_price_api(session, barcode),
-            get_product_from_google_shopping(session, barcode),
-            get_product_from_barcode_lookup(session, barcode)
-        ]
-        
-        print(f"\nFetching data for barcode: {barcode}")
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        # Combine all results
-        combined_data = {}
-        sources = []
-        all_stores = []
-        errors = []
-        
-        for i, result in enumerate(results):
-            if isinstance(result, Exception):
-                error_source = tasks[i].__name__.replace('get_product_from_', '')
-                print(f"Error from {error_source}: {str(result)}")
-                errors.append({
-                    'source': error_source,
-                    'error': str(result)
-                })
-                continue
-                
-            if result:
-                source = (result.get('source') or 
-                         result.get('source_upc') or 
-                         result.get('source_spider') or 
-                         result.get('source_google') or
-                         result.get('source_barcode_lookup'))
-                         
-                print(f"Got data from source: {source}")
+    """Fetch product data for a barcode, joining any fetch already in progress for it"""
+    product_data = get_cached_product(barcode)
+    if product_data is not None:
+        return product_data
+    
+    task = in_flight_lookups.get(barcode)
+    if task is None:
+        task = asyncio.create_task(fetch_from_all_sources(barcode))
+        in_flight_lookups[barcode] = task
+        task.add_done_callback(lambda _: in_flight_lookups.pop(barcode, None))
+    
+    # Shielded so one client disconnecting doesn't cancel the fetch for everyone else
+    return await asyncio.shield(task)
+
+async def fetch_from_all_sources(barcode):
+    """Fetch product data from all available sources, stopping early once the result is usable"""
+    session = await get_session()
+    page_session = await get_page_session()
+    api_client = await get_api_client()
+    source_fetchers = [
+        (get_product_from_open_food_facts, session),
+        (get_product_from_upc_database, api_client),
+        (get_product_from_barcode_spider, api_client),
+        (get_product_from_price_api, session),
+        (get_product_from_google_shopping, session),
+        (get_product_from_barcode_lookup, page_session)
+    ]
+    tasks = [
+        asyncio.create_task(
+            fetcher(client, barcode),
+            name=fetcher.__name__.replace('get_product_from_', '')
+        )
+        for fetcher, client in source_fetchers
+    ]
+    
+    logger.debug("Fetching data for barcode: %s", barcode)
+    
+    # Combine results as they arrive
+    combined_data = {}
+    sources = []
+    all_stores = []  # (sort price, store) pairs
+    seen_stores = set()
+    lowest_price = float('inf')
+    errors = []
+    
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + SOURCE_TIMEOUT
+    pending = set(tasks)
+    
+    try:
+        while pending:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(
+                pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+            )
+            
+            for task in done:
+                if task.exception() is not None:
+                    error_source = task.get_name()
+                    logger.warning("Error from %s: %s", error_source, task.exception())
+                    errors.append({
+                        'source': error_source,
+                        'error': str(task.exception())
+                    })
+                    continue
+                    
+                result = task.result()
+                if not result:
+                    continue
+                    
+                source = result.get('source')
+                logger.debug("Got data from source: %s", source)
                 
                 # Track which sources provided data
                 if source:
                     sources.append(source)
                 
-                # Add store information
+                # Add store information, skipping offers another source already reported
+                result_stores = list(result.get('all_stores') or [])
                 if 'store' in result:
-                    all_stores.append(result['store'])
+                    result_stores.insert(0, result['store'])
+                
+                offers = []
+                for store in result_stores:
+                    store_key = (store.get('store_name'), store.get('link'))
+                    if store_key in seen_stores:
+                        continue
+                    seen_stores.add(store_key)
+                    offer = (store_sort_price(store), store)
+                    all_stores.append(offer)
+                    offers.append(offer)
                 
-                # Add stores from APIs
-                if 'all_stores' in result and result['all_stores']:
-                    for store in result['all_stores']:
-                        if store not in all_stores:  # Avoid duplicates
-                            all_stores.append(store)
+                # Keep the cheapest price seen so far as the main price; a product-level
+                # price counts too, since not every source attaches it to a store
+                offers.append((store_sort_price(result), result))
+                price, offer = min(offers, key=itemgetter(0))
+                if price < lowest_price:
+                    lowest_price = price
+                    combined_data['price'] = offer['price']
+                    combined_data['currency'] = offer.get('currency')
                 
-                # Update other fields
+                # Fill in product fields the earlier sources left empty
                 for key, value in result.items():
-                    if key not in ['store', 'all_stores'] and value:
-                        if key not in combined_data or not combined_data[key]:
-                            combined_data[key] = value
-        
-        if combined_data:
-            # Sort stores by price
-            all_stores.sort(key=lambda x: float(x['price']) if x.get('price') else float('inf'))
-            combined_data['all_stores'] = all_stores
-            combined_data['data_sources'] = sources
-            combined_data['errors'] = errors if errors else None
-            
-            # Set the lowest price as the main price
-            if all_stores:
-                combined_data['price'] = all_stores[0]['price']
-                combined_data['currency'] = all_stores[0]['currency']
+                    if value and key in PRODUCT_FIELDS and not combined_data.get(key):
+                        combined_data[key] = value
             
-            print(f"Final combined data: {json.dumps(combined_data, indent=2)}")
-            return combined_data
+            # Don't wait on slower sources once the essentials are in
+            if all(combined_data.get(field) for field in SUFFICIENT_FIELDS):
+                break
+    finally:
+        # Drop whatever is still in flight, recording sources that ran out of time
+        timed_out = bool(pending) and loop.time() >= deadline
+        for task in pending:
+            task.cancel()
+            if timed_out:
+                errors.append({
+                    'source': task.get_name(),
+                    'error': 'Timed out'
+                })
+    
+    if combined_data:
+        # Sort stores by price, the only sort across all sources
+        all_stores.sort(key=itemgetter(0))
+        all_stores = [store for _, store in all_stores]
+        combined_data['all_stores'] = all_stores
+        combined_data['data_sources'] = sources
+        combined_data['errors'] = errors if errors else None
         
-        if errors:
-            print(f"All sources failed: {json.dumps(errors, indent=2)}")
-        return None
+        logger.debug("Final combined data: %s", combined_data)
+        if timed_out:
+            partial_product_cache[barcode] = combined_data
+        else:
+            product_cache[barcode] = combined_data
+        return combined_data
+    
+    if errors:
+        logger.warning("All sources failed: %s", errors)
+    return None
+
+@app.before_serving
+async def startup():
+    global _exchange_rate_task
+    await get_session()
+    await get_page_session()
+    await get_api_client()
+    refreshed = await refresh_exchange_rates()
+    _exchange_rate_task = asyncio.create_task(refresh_exchange_rates_periodically(refreshed))
+
+@app.after_serving
+async def shutdown():
+    if _exchange_rate_task is not None:
+        _exchange_rate_task.cancel()
+    await close_session()
+    await close_page_session()
+    await close_api_client()
+    if redis_client is not None:
+        await redis_client.aclose()
 
 @app.route('/')
-def index():
-    return render_template('index.html')
+async def index():
+    return await render_template('index.html')
 
 @app.route('/lookup/<barcode>', methods=['GET'])
-def lookup_barcode(barcode):
+async def lookup_barcode(barcode):
     """Lookup barcode information"""
     try:
-        if not check_rate_limit():
-            return jsonify({
-                'error': 'Rate limit exceeded',
-                'message': 'Please wait before making another request'
-            }), 429
-        
-        request_timestamps.append(datetime.now())
-        
-        # Validate barcode format
-        if not barcode.isdigit():
+        # Validate barcode format once, before spending any upstream API calls
+        barcode = clean_barcode_digits(barcode)
+        if not is_valid_gtin(barcode):
             return jsonify({
                 'error': 'Invalid barcode',
-                'message': 'Barcode must contain only numbers'
+                'message': 'Barcode must be an 8 to 14 digit UPC/EAN with a valid check digit'
             }), 400
+        
+        # Cached products cost no upstream calls, so they skip the rate limit
+        product_data = get_cached_product(barcode)
+        if product_data is None:
+            if not await check_rate_limit(request.remote_addr):
+                return jsonify({
+                    'error': 'Rate limit exceeded',
+                    'message': 'Please wait before making another request'
+                }), 429
             
-        # Run the async function in the event loop
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        product_data = loop.run_until_complete(fetch_all_product_data(barcode))
-        loop.close()
+            product_data = await fetch_all_product_data(barcode)
         
         if not product_data:
             return jsonify({
@@ -742,14 +1143,15 @@ def lookup_barcode(barcode):
                 'barcode': barcode
             }), 404
             
-        # Add request metadata
+        # Add request metadata without touching the cached copy
+        product_data = dict(product_data)
         product_data['request_time'] = datetime.now().isoformat()
         product_data['barcode'] = barcode
         
         return jsonify(product_data)
         
     except Exception as e:
-        print(f"Error processing barcode {barcode}: {str(e)}")
+        logger.exception("Error processing barcode %s: %s", barcode, e)
         return jsonify({
             'error': 'Server error',
             'message': str(e),